@@ -1,11 +1,46 @@
-import re, string, calendar
+import os, re, string, calendar, types
+from functools import lru_cache
+import requests
+import requests_cache
 from wikipedia import WikipediaPage
 import wikipedia
-from bs4 import BeautifulSoup
-from nltk import word_tokenize, pos_tag, ne_chunk
-from nltk.tree import Tree
+import lxml.html
 from match import match
-from typing import List, Callable, Tuple, Any, Match
+from typing import List, Callable, Tuple, Any, Match, Dict
+
+USER_AGENT = "a10-wikipedia-chatbot (https://github.com/LT-Intro-To-AI-SY2425)"
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "wiki_cache")
+
+
+@lru_cache(maxsize=None)
+def get_session() -> requests_cache.CachedSession:
+    """Gets the session shared by all of wikipedia's API calls. It keeps connections
+    open between queries and caches responses on disk so repeat queries skip the
+    network (in a cache file next to this one). It is only made on first use, so just
+    importing this file doesn't create the cache
+
+    Returns:
+        the shared session
+    """
+    return requests_cache.CachedSession(CACHE_PATH, expire_after=7 * 24 * 3600)
+
+
+def session_get(*args: Any, **kwargs: Any) -> requests.Response:
+    """Stands in for requests.get, sending the request through the shared session
+
+    Args:
+        args, kwargs - same as requests.get
+
+    Returns:
+        the response
+    """
+    return get_session().get(*args, **kwargs)
+
+
+# wikipedia's only use of its requests import is requests.get, so a stand-in with just
+# that is enough to send all of its calls through the shared session
+wikipedia.set_user_agent(USER_AGENT)
+wikipedia.wikipedia.requests = types.SimpleNamespace(get=session_get)
 
 
 def get_page_html(title: str) -> str:
@@ -30,12 +65,36 @@ def get_first_infobox_text(html: str) -> str:
     Returns:
         html of just the first infobox
     """
-    soup = BeautifulSoup(html, "html.parser")
-    results = soup.find_all(class_="infobox")
+    tree = lxml.html.fromstring(html)
+    results = tree.xpath(
+        "//*[contains(concat(' ', normalize-space(@class), ' '), ' infobox ')]"
+    )
 
     if not results:
         raise LookupError("Page has no infobox")
-    return results[0].text
+
+    # bs4's .text left out style and script contents (infobox cells often hold inline
+    # TemplateStyles css) but text_content() doesn't, so drop them first
+    infobox = results[0]
+    for node in infobox.xpath(".//style|.//script"):
+        node.drop_tree()
+    return infobox.text_content()
+
+
+class NonPrintableTable(dict):
+    """Translation table for str.translate mapping every non-printable character to a
+    space. Entries are filled in the first time a character is seen rather than built
+    for all of unicode up front"""
+
+    def __missing__(self, code: int) -> str:
+        char = chr(code)
+        self[code] = char if char in string.printable else " "
+        return self[code]
+
+
+NON_PRINTABLE_TO_SPACE = NonPrintableTable()
+DUP_SPACES = re.compile(" +")
+DUP_NEWLINES = re.compile("\n+")
 
 
 def clean_text(text: str) -> str:
@@ -47,12 +106,39 @@ def clean_text(text: str) -> str:
     Returns:
         cleaned text
     """
-    only_ascii = "".join([char if char in string.printable else " " for char in text])
-    no_dup_spaces = re.sub(" +", " ", only_ascii)
-    no_dup_newlines = re.sub("\n+", "\n", no_dup_spaces)
+    only_ascii = text.translate(NON_PRINTABLE_TO_SPACE)
+    no_dup_spaces = DUP_SPACES.sub(" ", only_ascii)
+    no_dup_newlines = DUP_NEWLINES.sub("\n", no_dup_spaces)
     return no_dup_newlines
 
 
+@lru_cache(maxsize=256)
+def get_infobox_text(title: str) -> str:
+    """Gets the cleaned text of the first infobox of a wikipedia page, remembering it so
+    that asking several questions about the same page only fetches and parses it once
+
+    Args:
+        title - title of the page
+
+    Returns:
+        cleaned text of the page's first infobox
+    """
+    return clean_text(get_first_infobox_text(get_page_html(title)))
+
+
+@lru_cache(maxsize=64)
+def compile_pattern(pattern: str) -> re.Pattern:
+    """Compiles a regex pattern once and reuses it for every later query
+
+    Args:
+        pattern - pattern to compile
+
+    Returns:
+        compiled pattern (dot matches newlines, case is ignored)
+    """
+    return re.compile(pattern, re.DOTALL | re.IGNORECASE)
+
+
 def get_match(
     text: str,
     pattern: str,
@@ -68,8 +154,7 @@ def get_match(
     Returns:
         text that matches
     """
-    p = re.compile(pattern, re.DOTALL | re.IGNORECASE)
-    match = p.search(text)
+    match = compile_pattern(pattern).search(text)
 
     if not match:
         raise AttributeError(error_text)
@@ -85,8 +170,8 @@ def get_polar_radius(planet_name: str) -> str:
     Returns:
         radius of the given planet
     """
-    infobox_text = clean_text(get_first_infobox_text(get_page_html(planet_name)))
-    pattern = r"(?:Polar radius.*?)(?: ?[\d]+ )?(?P<radius>[\d,.]+)(?:.*?)km"
+    infobox_text = get_infobox_text(planet_name)
+    pattern = r"Polar radius[^\d,.]*(?: ?\d+ )?(?P<radius>[\d,.]+)(?![\d,.]).*?km"
     error_text = "Page infobox has no polar radius information"
     match = get_match(infobox_text, pattern, error_text)
 
@@ -102,7 +187,7 @@ def get_birth_date(name: str) -> str:
     Returns:
         birth date of the given person
     """
-    infobox_text = clean_text(get_first_infobox_text(get_page_html(name)))
+    infobox_text = get_infobox_text(name)
     pattern = r"(?:Born\D*)(?P<birth>\d{4}-\d{2}-\d{2})"
     error_text = (
         "Page infobox has no birth information (at least none in xxxx-xx-xx format)"
@@ -122,8 +207,8 @@ def get_population(location_name: str) -> str:
     Returns:
         population of the given country or city
     """
-    infobox_text = clean_text(get_first_infobox_text(get_page_html(location_name)))
-    pattern = r"(?:Population.*?)(?P<population>[\d,]+)(?:.*?)\s*people"
+    infobox_text = get_infobox_text(location_name)
+    pattern = r"Population[^\d,]*(?P<population>[\d,]+)(?![\d,]).*?people"
     error_text = "Page infobox has no population information"
     match = get_match(infobox_text, pattern, error_text)
 
@@ -138,12 +223,12 @@ def get_official_language(country_name: str) -> str:
     Returns:
         official language(s) of the given country
     """
-    infobox_text = clean_text(get_first_infobox_text(get_page_html(country_name)))
-    pattern = r"(?:Official\s*languages.*?)(?P<languages>[\w\s,/-]+)(?:.*?)\n"
+    infobox_text = get_infobox_text(country_name)
+    pattern = r"Official\s*languages(?:\[\w+\])?\s*(?P<languages>\w[\w ,/-]*)"
     error_text = "Page infobox has no official language information"
     match = get_match(infobox_text, pattern, error_text)
 
-    return match.group("languages")
+    return match.group("languages").strip()
 
 def get_birth_place(name: str) -> str:
     """Gets the birth city and country of the given person
@@ -154,7 +239,7 @@ def get_birth_place(name: str) -> str:
     Returns:
         City and country of the given person
     """
-    infobox_text = clean_text(get_first_infobox_text(get_page_html(name)))
+    infobox_text = get_infobox_text(name)
     
     # Regex pattern to capture city and country from the birth info
     pattern = r"in\s*([A-Za-z\s]+),\s*([A-Za-z\s]+)"
@@ -243,6 +328,29 @@ pa_list: List[Tuple[Pattern, Action]] = [
 ]
 
 
+def index_pa_list(patterns: List[Tuple[Pattern, Action]]) -> Dict[str, List[int]]:
+    """Groups the positions of pa_list patterns by their first word, so a query only has
+    to be matched against the patterns that start with the same word. Patterns starting
+    with % or _ (or empty patterns) can match any first word, so they're grouped under
+    the empty string and tried for every query
+
+    Args:
+        patterns - the pattern-action list to index
+
+    Returns:
+        dictionary from first word to the positions in patterns of the patterns
+        starting with it
+    """
+    index: Dict[str, List[int]] = {}
+    for pos, (pat, _) in enumerate(patterns):
+        key = pat[0] if pat and pat[0] not in ("%", "_") else ""
+        index.setdefault(key, []).append(pos)
+    return index
+
+
+pa_index = index_pa_list(pa_list)
+
+
 def search_pa_list(src: List[str]) -> List[str]:
     """Takes source, finds matching pattern and calls corresponding action. If it finds
     a match but has no answers it returns ["No answers"]. If it finds no match it
@@ -255,7 +363,11 @@ def search_pa_list(src: List[str]) -> List[str]:
         a list of answers. Will be ["I don't understand"] if it finds no matches and
         ["No answers"] if it finds a match but no answers
     """
-    for pat, act in pa_list:
+    # keep pa_list order so the first matching pattern still wins
+    first = pa_index.get(src[0], []) if src else []
+    candidates = sorted(first + pa_index.get("", []))
+    for pos in candidates:
+        pat, act = pa_list[pos]
         mat = match(pat, src)
         if mat is not None:
             answer = act(mat)
@@ -282,5 +394,6 @@ def query_loop() -> None:
     print("\nSo long!\n")
 
 
-# uncomment the next line once you've implemented everything are ready to try it out
-query_loop()
+# start the chatbot when this file is run directly, but not when it is imported
+if __name__ == "__main__":
+    query_loop()